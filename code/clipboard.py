@@ -1,36 +1,292 @@
 # clipboard.py
+import queue
 import subprocess
+import threading
+import Xlib.threaded  # noqa: F401 - must be imported before any Display is opened
+from Xlib import X, Xatom, error
+from Xlib.display import Display
+from Xlib.ext import xfixes
+from Xlib.protocol import event as xevent
+
+SELECTION_TIMEOUT = 1.0
+# INCR transfers are read by xsel, which would otherwise wait forever on a stalled owner
+XSEL_TIMEOUT = 5.0
+# Fixed part of a ChangeProperty request; the rest of the request is property data
+CHANGE_PROPERTY_HEADER_BYTES = 24
+
 
 class ClipboardManager:
-    def __init__(self):
-        """Initialize the clipboard manager using xsel."""
+    def __init__(self, display=None):
+        """Initialize the clipboard manager on an X11 connection.
+
+        Args:
+            display: An open Xlib display to use. A new connection is opened if omitted.
+        """
         try:
             subprocess.run(['which', 'xsel'], check=True, capture_output=True)
         except subprocess.CalledProcessError:
             raise RuntimeError("xsel is not installed. Please install it with: sudo apt-get install xsel")
-        
+
+        self.display = display or Display()
+        self.root = self.display.screen().root
+        self.window = self.root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.notify_window = self.root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.clipboard_atom = self.display.intern_atom('CLIPBOARD')
+        self.utf8_atom = self.display.intern_atom('UTF8_STRING')
+        self.incr_atom = self.display.intern_atom('INCR')
+        self.targets_atom = self.display.intern_atom('TARGETS')
+        self.text_atom = self.display.intern_atom('TEXT')
+        self.property_atom = self.display.intern_atom('COPYCLIP_SELECTION')
+        # python-xlib has no BIG-REQUESTS support, so one property must fit in a
+        # single request; larger payloads need INCR, which xsel implements for us
+        self.max_owned_bytes = (self.display.display.info.max_request_length * 4
+                                - CHANGE_PROPERTY_HEADER_BYTES)
+
+        self._replies = queue.Queue()
+        self._read_lock = threading.Lock()
+        self.on_change = None
+        self._owned_value = None
+        self.current_clipboard = None
+        self.watching = self._watch_selection()
+        threading.Thread(target=self._event_loop, daemon=True).start()
+
         self.current_clipboard = self.get_clipboard_content()
+
+    def _watch_selection(self):
+        """Ask XFixes to report CLIPBOARD owner changes.
+
+        Returns:
+            bool: True if change notifications are active, False if the
+            server lacks XFixes and callers must poll instead.
+        """
+        try:
+            if not self.display.has_extension('XFIXES'):
+                return False
+            self.display.xfixes_query_version()
+            self.display.xfixes_select_selection_input(
+                self.root, self.clipboard_atom, xfixes.XFixesSetSelectionOwnerNotifyMask)
+            self.display.flush()
+            return True
+        except Exception as e:
+            print(f"XFixes unavailable, falling back to polling: {e}")
+            return False
+
+    def _event_loop(self):
+        """Read X events for the clipboard windows and dispatch them in batches.
+
+        Every event already queued is handled before the output buffer is
+        flushed, so replies and requests issued while handling a burst go
+        out together.
+        """
+        while True:
+            try:
+                self._dispatch_event(self.display.next_event())
+                while self.display.pending_events():
+                    self._dispatch_event(self.display.next_event())
+                self.display.flush()
+            except error.ConnectionClosedError as e:
+                print(f"Clipboard event loop stopped: {e}")
+                return
+            except Exception as e:
+                print(f"Error in clipboard event loop: {e}")
+
+    def _dispatch_event(self, event):
+        """Route a single X event to its handler.
+
+        A failing handler is logged and skipped; this thread records every
+        clip and answers every paste, so it must outlive any one event.
+        """
+        try:
+            self._route_event(event)
+        except error.ConnectionClosedError:
+            raise
+        except Exception as e:
+            print(f"Error handling clipboard event: {e}")
+
+    def _route_event(self, event):
+        """Send a single X event to its handler."""
+        if self.watching and (event.type, getattr(event, 'sub_code', None)) == \
+                self.display.extension_event.SetSelectionOwnerNotify:
+            if event.owner != self.window:
+                self._request_notify_content()
+        elif event.type == X.SelectionRequest:
+            self._serve_selection_request(event)
+        elif event.type == X.SelectionClear:
+            # A copy may have taken the selection back since this was sent
+            if self.display.get_selection_owner(self.clipboard_atom) != self.window:
+                self._owned_value = None
+        elif event.type == X.SelectionNotify:
+            if event.requestor == self.notify_window:
+                self._handle_notify_content(event)
+            else:
+                self._replies.put(event)
+
+    def _serve_selection_request(self, event):
+        """Answer another client's request for the content we own.
+
+        A SelectionNotify is always sent, with property NONE when the request
+        cannot be served, so the requestor never waits for a timeout.
+        """
+        value = self._owned_value
+        # Obsolete clients may leave the property unset
+        prop = event.property if event.property != X.NONE else event.target
+        try:
+            if value is None:
+                prop = X.NONE
+            elif event.target == self.targets_atom:
+                event.requestor.change_property(
+                    prop, Xatom.ATOM, 32,
+                    [self.targets_atom, self.utf8_atom, self.text_atom, Xatom.STRING])
+            elif event.target in (self.utf8_atom, self.text_atom, Xatom.STRING):
+                if event.target == Xatom.STRING:
+                    prop_type, data = Xatom.STRING, value.encode('latin-1', errors='replace')
+                else:
+                    prop_type, data = self.utf8_atom, value.encode('utf-8')
+                if len(data) <= self.max_owned_bytes:
+                    event.requestor.change_property(prop, prop_type, 8, data)
+                else:
+                    prop = X.NONE
+            else:
+                prop = X.NONE
+        except Exception as e:
+            print(f"Error serving clipboard request: {e}")
+            prop = X.NONE
+
+        try:
+            reply = xevent.SelectionNotify(
+                time=event.time,
+                requestor=event.requestor,
+                selection=event.selection,
+                target=event.target,
+                property=prop)
+            event.requestor.send_event(reply)
+        except Exception as e:
+            print(f"Error answering clipboard request: {e}")
+
+    def _request_notify_content(self, target=None):
+        """Ask the new selection owner for its content without waiting for the reply."""
+        self.notify_window.convert_selection(
+            self.clipboard_atom, target or self.utf8_atom, self.property_atom, X.CurrentTime)
+
+    def _decode_property(self, prop):
+        """Decode converted selection text, reading INCR transfers through xsel."""
+        if prop.property_type == self.incr_atom:
+            # Large transfers are chunked by the owner; let xsel handle them
+            return self._read_with_xsel()
+        if prop.property_type == Xatom.STRING:
+            return prop.value.decode('latin-1').strip()
+        return prop.value.decode('utf-8', errors='replace').strip()
+
+    def _handle_notify_content(self, event):
+        """Pass content announced by an owner change to the on_change callback."""
+        if event.property == X.NONE:
+            # Like xsel, fall back to STRING for owners without UTF8_STRING
+            if event.target == self.utf8_atom:
+                self._request_notify_content(Xatom.STRING)
+            return
+        try:
+            prop = self.notify_window.get_full_property(self.property_atom, X.AnyPropertyType)
+            self.notify_window.delete_property(self.property_atom)
+            if prop is None:
+                return
+            content = self._decode_property(prop)
+        except Exception as e:
+            print(f"Error reading changed clipboard content: {e}")
+            return
+
+        if content and content != self.current_clipboard:
+            self.current_clipboard = content
+            if self.on_change:
+                try:
+                    self.on_change(content)
+                except Exception as e:
+                    print(f"Error recording clipboard change: {e}")
+
+    def _convert_selection(self, target):
+        """Convert the CLIPBOARD selection to target and wait for the owner's reply.
+        
+        Returns:
+            The converted property, or None if the owner refused the conversion.
         
+        Raises:
+            queue.Empty: If the owner did not answer within SELECTION_TIMEOUT.
+        """
+        with self._read_lock:
+            # Discard replies to earlier requests that timed out
+            while not self._replies.empty():
+                self._replies.get_nowait()
+
+            self.window.convert_selection(
+                self.clipboard_atom, target, self.property_atom, X.CurrentTime)
+            self.display.flush()
+            event = self._replies.get(timeout=SELECTION_TIMEOUT)
+            if event.property == X.NONE:
+                return None
+
+            prop = self.window.get_full_property(self.property_atom, X.AnyPropertyType)
+            self.window.delete_property(self.property_atom)
+            return prop
+
     def get_clipboard_content(self):
-        """Get the current content of the clipboard using xsel."""
+        """Get the current content of the clipboard by converting the CLIPBOARD selection."""
+        if self._owned_value is not None:
+            return self._owned_value
         try:
-            result = subprocess.run(['xsel', '-b', '-o'], capture_output=True, text=True)
-            return result.stdout.strip()
+            prop = self._convert_selection(self.utf8_atom)
+            if prop is None:
+                # Like xsel, fall back to STRING for owners without UTF8_STRING
+                prop = self._convert_selection(Xatom.STRING)
+            if prop is None:
+                return ""
+            return self._decode_property(prop)
+        except queue.Empty:
+            print("Error getting clipboard content: selection owner did not respond")
+            return None
         except Exception as e:
             print(f"Error getting clipboard content: {e}")
             return None
-    
+
+    def _read_with_xsel(self):
+        """Get the current content of the clipboard using xsel.
+        
+        Returns:
+            str: The clipboard content, or None if xsel did not finish within XSEL_TIMEOUT.
+        """
+        try:
+            result = subprocess.run(
+                ['xsel', '-b', '-o'], capture_output=True, text=True, timeout=XSEL_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print("Error reading clipboard with xsel: selection owner stalled")
+            return None
+        return result.stdout.strip()
+
     def set_clipboard_content(self, content):
-        """Sets a new clipboard content using xsel."""
+        """Sets a new clipboard content by taking ownership of the CLIPBOARD selection.
+
+        Falls back to xsel for payloads too large to send in one property
+        or if ownership could not be acquired.
+        """
         try:
-            process = subprocess.Popen(['xsel', '-b', '-i'], stdin=subprocess.PIPE)
-            process.communicate(input=content.encode())
-            self.current_clipboard = content
-            return True
+            if len(content.encode('utf-8')) <= self.max_owned_bytes:
+                self._owned_value = content
+                self.window.set_selection_owner(self.clipboard_atom, X.CurrentTime)
+                if self.display.get_selection_owner(self.clipboard_atom) == self.window:
+                    self.current_clipboard = content
+                    return True
+                self._owned_value = None
+            return self._write_with_xsel(content)
         except Exception as e:
             print(f"Error setting clipboard: {e}")
-            return False  
-    
+            return False
+
+    def _write_with_xsel(self, content):
+        """Sets a new clipboard content using xsel."""
+        self._owned_value = None
+        process = subprocess.Popen(['xsel', '-b', '-i'], stdin=subprocess.PIPE)
+        process.communicate(input=content.encode())
+        self.current_clipboard = content
+        return True
+
     def check_for_new_content(self):
         """Checks if the clipboard content has changed."""
         try:
@@ -1,94 +1,193 @@
 # history_manager.py
 import os
-import json
+import queue
+import atexit
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
+from code.jsonio import json_dumps, json_loads
+
+SAVE_DELAY = 0.5
+MAX_ITEMS = 200
+# Clips beyond this many characters (e.g. copied binaries) are truncated
+MAX_CONTENT_CHARS = 1024 * 1024
+LEGACY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 class HistoryManager:
     """Manages the clipboard history and its persistent storage."""
     
-    def __init__(self, clipboard_manager):
+    def __init__(self, clipboard_manager, max_items=MAX_ITEMS):
         """Initialize the history manager with a clipboard manager instance.
         
         Args:
             clipboard_manager: The clipboard manager instance to work with.
+            max_items: How many unpinned items to keep. Pinned items are never dropped.
         """
         self.clipboard_manager = clipboard_manager
+        self.max_items = max_items
         self.data_dir = os.path.join(
             os.getenv('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'clipboard-manager')
         Path(self.data_dir).mkdir(parents=True, exist_ok=True)
         
         self.history_file = os.path.join(self.data_dir, 'clipboard_history.json')
-        self.history = self.load_history()
+        # Maps content -> item, kept in most-recently-used order
+        self._order = OrderedDict((item['content'], item) for item in self.load_history())
+        # Kept up to date so trimming never has to count pinned items
+        self._pinned_count = sum(1 for item in self._order.values() if item.get('pinned', False))
+        
+        self._lock = threading.RLock()
+        self._sorted_cache = None
+        self._sorted_cache_dirty = True
+        self._save_pending = False
+        self._write_lock = threading.Lock()
+        self._save_q = queue.Queue()
+        threading.Thread(target=self._saver, daemon=True).start()
+        atexit.register(self._flush_pending)
+
+    @property
+    def history(self):
+        """list: History items, most recently used first."""
+        return list(self._order.values())
 
     def load_history(self):
         """Load clipboard history from the JSON file.
         
+        A file that cannot be parsed is moved aside to a .corrupted file so
+        the next save does not overwrite it.
+        
         Returns:
-            list: The loaded history or an empty list if loading fails.
+            list: The loaded history, newest first, or an empty list if loading fails.
         """
+        if not os.path.exists(self.history_file):
+            return []
         try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as file:
-                    return json.load(file)
+            with open(self.history_file, 'rb') as file:
+                history = json_loads(file.read())
+            for item in history:
+                # Older files stored formatted strings instead of epoch seconds
+                if isinstance(item['timestamp'], str):
+                    item['timestamp'] = self._parse_legacy_timestamp(item['timestamp'])
+            history.sort(key=lambda x: x['timestamp'], reverse=True)
+            return history
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"History file is corrupted, starting with an empty history: {e}")
+            try:
+                os.rename(self.history_file, f"{self.history_file}.corrupted")
+            except OSError as e:
+                print(f"Error setting aside corrupted history: {e}")
         except Exception as e:
             print(f"Error loading history: {e}")
         return []
+
+    def _parse_legacy_timestamp(self, timestamp):
+        """Convert a formatted timestamp from an older history file to epoch seconds.
+        
+        Strings in any other format fall back to the history file's
+        modification time rather than failing the whole load.
+        """
+        try:
+            return int(datetime.strptime(timestamp, LEGACY_TIMESTAMP_FORMAT).timestamp())
+        except ValueError:
+            return int(os.path.getmtime(self.history_file))
     
     def get_pinned_items(self):
         """Get all pinned items from history."""
-        return [item for item in self.history if item['pinned']]
+        return [item for item in self._order.values() if item['pinned']]
 
 
 
     def save_history(self):
+        """Queue the clipboard history to be saved by the background writer.
+        
+        The caller never waits on disk I/O, and a burst of changes results
+        in a single write.
+        """
+        with self._lock:
+            self._save_pending = True
+        self._save_q.put(None)
+
+    def _saver(self):
+        """Background writer that coalesces queued saves into one write."""
+        while True:
+            self._save_q.get()
+            time.sleep(SAVE_DELAY)
+            # Requests that arrived meanwhile are covered by this write
+            while not self._save_q.empty():
+                self._save_q.get_nowait()
+            self._flush_history()
+
+    def _flush_pending(self):
+        """Write out a save that the background writer has not reached yet."""
+        # Waiting for the write lock lets a write already in progress finish
+        with self._write_lock:
+            pending = self._save_pending
+        if pending:
+            self._flush_history()
+
+    def _flush_history(self):
         """Save the current clipboard history to the JSON file."""
-        try:
-            os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
-            
-            if os.path.exists(self.history_file):
-                backup_file = f"{self.history_file}.backup"
-                try:
-                    os.replace(self.history_file, backup_file)
-                except Exception as e:
-                    print(f"Warning: Could not create backup: {e}")
-            
-            with open(self.history_file, 'w', encoding='utf-8') as file:
-                json.dump(self.history, file, ensure_ascii=False, indent=2)
+        tmp_file = f"{self.history_file}.tmp"
+        with self._write_lock:
+            # Cleared under the write lock, so _flush_pending either sees the
+            # flag still set or waits for this write to reach the disk
+            with self._lock:
+                self._save_pending = False
+                items = list(self._order.values())
+            try:
+                os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
                 
-        except Exception as e:
-            print(f"Error saving history: {e}")
-            if os.path.exists(backup_file):
-                try:
-                    os.replace(backup_file, self.history_file)
-                except Exception as restore_error:
-                    print(f"Error restoring from backup: {restore_error}")
+                # Write beside the target and rename over it so the file is never missing or partial
+                with open(tmp_file, 'wb') as file:
+                    file.write(json_dumps(items))
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_file, self.history_file)
+                    
+            except Exception as e:
+                print(f"Error saving history: {e}")
 
     def add_to_history(self, content):
         """Add a new item to the clipboard history.
         
-        If the item already exists, it is moved to the top of the history.
+        If the item already exists, it is moved to the top of the history
+        with a fresh timestamp and its pinned state kept.
         
         Args:
             content: The content to add to the history.
         """
         if content and content.strip():
-            for item in self.history:
-                if item['content'] == content:
-                    self.history.remove(item)
-                    self.history.insert(0, item)
-                    self.save_history()
-                    return
-                    
-            # Add new item
-            new_item = {
-                'content': content,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'pinned': False
-            }
-            self.history.insert(0, new_item)
+            content = content[:MAX_CONTENT_CHARS]
+            with self._lock:
+                # A single hash lookup; full strings are only compared on a hash match
+                item = self._order.get(content)
+                if item is None:
+                    item = self._order[content] = {'content': content, 'pinned': False}
+                item['timestamp'] = int(time.time())
+                self._order.move_to_end(content, last=False)
+                self._trim_history()
+                self._sorted_cache_dirty = True
             self.save_history()
 
+    def _trim_history(self):
+        """Drop the least recently used unpinned items beyond max_items.
+        
+        Walks from the least recently used end and stops as soon as enough
+        items are gone, so a full history trims in constant time per add.
+        """
+        excess = len(self._order) - self._pinned_count - self.max_items
+        if excess <= 0:
+            return
+        stale = []
+        for content in reversed(self._order):
+            if not self._order[content].get('pinned', False):
+                stale.append(content)
+                if len(stale) == excess:
+                    break
+        for content in stale:
+            del self._order[content]
+
     def toggle_pin(self, content):
         """Toggle the pinned status of a history item.
         
@@ -98,12 +197,15 @@ class HistoryManager:
         Returns:
             bool: The new pinned status of the item.
         """
-        for item in self.history:
-            if item['content'] == content:
-                item['pinned'] = not item['pinned']
-                self.save_history()
-                return item['pinned']
-        return False
+        with self._lock:
+            item = self._order.get(content)
+            if item is None:
+                return False
+            item['pinned'] = not item['pinned']
+            self._pinned_count += 1 if item['pinned'] else -1
+            self._sorted_cache_dirty = True
+        self.save_history()
+        return item['pinned']
     
     def clear_history(self):
         """Clear history while preserving pinned items.
@@ -113,8 +215,10 @@ class HistoryManager:
         2. Keep only pinned items in history
         3. Save the updated history
         """
-        pinned_items = [item for item in self.history if item.get('pinned', False)]
-        self.history = pinned_items
+        with self._lock:
+            self._order = OrderedDict(
+                (content, item) for content, item in self._order.items() if item.get('pinned', False))
+            self._sorted_cache_dirty = True
         self.save_history()
 
     def remove_item(self, content):
@@ -123,22 +227,36 @@ class HistoryManager:
         Args:
             content: The content of the item to remove.
         """
-        self.history = [item for item in self.history if item['content'] != content]
-        self.save_history()
+        with self._lock:
+            removed = self._order.pop(content, None)
+            if removed is not None and removed.get('pinned', False):
+                self._pinned_count -= 1
+            self._sorted_cache_dirty = True
+        if removed is not None:
+            self.save_history()
 
     def get_sorted_history(self):
-        """Get history with pinned items first, then unpinned items in chronological order.
+        """Get history with pinned items first, then unpinned items, each newest first.
+        
+        The underlying order is already most-recently-used first, so this is a
+        single partitioning pass with no sort. The result is cached until the
+        history changes and must not be modified by callers.
         
         Returns:
             list: Sorted history with pinned items first
         """
-        pinned = [item for item in self.history if item.get('pinned', False)]
-        unpinned = [item for item in self.history if not item.get('pinned', False)]
-        
-        pinned.sort(key=lambda x: x['timestamp'], reverse=True)
-        unpinned.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        return pinned + unpinned
+        with self._lock:
+            if not self._sorted_cache_dirty:
+                return self._sorted_cache
+            
+            pinned = []
+            unpinned = []
+            for item in self._order.values():
+                (pinned if item.get('pinned', False) else unpinned).append(item)
+            
+            self._sorted_cache = pinned + unpinned
+            self._sorted_cache_dirty = False
+            return self._sorted_cache
 
     def get_history(self):
         """Get the current clipboard history with pinned items first.
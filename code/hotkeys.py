@@ -1,47 +1,36 @@
 # hotkeys.py
 import threading
-import time
-import subprocess
-from Xlib import X, XK, display
+from Xlib import X, XK
+from Xlib.display import Display
 from Xlib.ext import record
 from Xlib.protocol import rq
 
 class HotkeyManager:
-    def __init__(self, clipboard_manager, history_manager, ui_manager):
+    def __init__(self, clipboard_manager, history_manager, ui_manager, display=None):
         self.clipboard_manager = clipboard_manager
         self.history_manager = history_manager
         self.ui_manager = ui_manager
-        self.display = display.Display()
+        # Shared connection for keysym lookups and control requests. An enabled
+        # RECORD context takes over its connection, so recording gets its own.
+        self.display = display or Display()
+        self.record_display = Display(self.display.get_display_name())
         self.root = self.display.screen().root
         self.ctx = None
         self.running = True
         
-        self.ctrl_pressed = False
         self.alt_pressed = False
         
     def key_pressed(self, key):
         keycode = key.detail
         keysym = self.display.keycode_to_keysym(keycode, 0)
-        if keysym == XK.XK_Control_L or keysym == XK.XK_Control_R:
-            self.ctrl_pressed = True
-        elif keysym == XK.XK_Super_L or keysym == XK.XK_Super_R:
+        if keysym == XK.XK_Super_L or keysym == XK.XK_Super_R:
             self.alt_pressed = True
-        elif keysym == XK.XK_c and self.ctrl_pressed:
-            time.sleep(0.1)
-            content = self.clipboard_manager.check_for_new_content()
-            if content:
-                # Add to history
-                self.history_manager.add_to_history(content)
-                # Keep it as current clipboard content
-                self.clipboard_manager.set_clipboard_content(content)
         elif keysym == XK.XK_v and self.alt_pressed:
             self.ui_manager.show_clipboard()
     def key_released(self, key):
         keycode = key.detail
         keysym = self.display.keycode_to_keysym(keycode, 0)
-        if keysym == XK.XK_Control_L or keysym == XK.XK_Control_R:
-            self.ctrl_pressed = False
-        elif keysym == XK.XK_Super_L or keysym == XK.XK_Super_R:
+        if keysym == XK.XK_Super_L or keysym == XK.XK_Super_R:
             self.alt_pressed = False
 
     def handler(self, reply):
@@ -54,16 +43,22 @@ class HotkeyManager:
         data = reply.data
         while len(data):
             event, data = rq.EventField(None).parse_binary_value(
-                data, self.display.display, None, None)
+                data, self.record_display.display, None, None)
             
             if event.type == X.KeyPress:
                 self.key_pressed(event)
             elif event.type == X.KeyRelease:
                 self.key_released(event)
 
+    def clipboard_changed(self, content):
+        """ Record content announced by a clipboard owner change """
+        self.history_manager.add_to_history(content)
+        self.ui_manager.schedule_refresh()
+
     def setup_hotkeys(self):
         """ Setup keyboard monitoring """
-        ctx = self.display.record_create_context(
+        self.clipboard_manager.on_change = self.clipboard_changed
+        self.ctx = self.record_display.record_create_context(
             0,
             [record.AllClients],
             [{
@@ -79,15 +74,18 @@ class HotkeyManager:
             }]
         )
         
-        threading.Thread(target=self.record_thread, args=(ctx,), daemon=True).start()
+        threading.Thread(target=self.record_thread, args=(self.ctx,), daemon=True).start()
 
     def record_thread(self, ctx):
         """ Thread function for keyboard monitoring """
-        self.display.record_enable_context(ctx, self.handler)
-        self.display.record_free_context(ctx)
+        self.record_display.record_enable_context(ctx, self.handler)
+        self.record_display.record_free_context(ctx)
 
     def stop_listening(self):
         """ Stop keyboard monitoring """
         self.running = False
-        if self.display:
-            self.display.close()
\ No newline at end of file
+        if self.ctx is not None:
+            self.display.record_disable_context(self.ctx)
+            self.display.flush()
+        if self.record_display:
+            self.record_display.close()
\ No newline at end of file
@@ -0,0 +1,19 @@
+# jsonio.py
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_dumps(obj):
+    """Serialize obj to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_loads(data):
+    """Parse UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,160 @@
+# search_index.py
+
+class _Node:
+    """Radix trie node holding a whole edge label instead of a single character."""
+
+    __slots__ = ('prefix', 'children', 'keys')
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.children = {}
+        self.keys = set()
+
+
+def _common_prefix_length(a, b):
+    """Return the length of the common prefix of two strings."""
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class PrefixTrie:
+    """Radix trie mapping string prefixes to the set of keys inserted under them.
+
+    Every node stores the keys of its whole subtree, so a prefix lookup walks
+    the query once and returns without visiting the subtree.
+    """
+
+    def __init__(self):
+        self.root = _Node('')
+
+    def insert(self, text, key):
+        """Insert text and record key on every node along its path.
+
+        Args:
+            text: The string to insert.
+            key: The value returned by lookups of any prefix of text.
+        """
+        node = self.root
+        node.keys.add(key)
+        while text:
+            child = node.children.get(text[0])
+            if child is None:
+                child = _Node(text)
+                child.keys.add(key)
+                node.children[text[0]] = child
+                return
+
+            common = _common_prefix_length(child.prefix, text)
+            if common < len(child.prefix):
+                # Split the edge where the new text diverges
+                split = _Node(child.prefix[:common])
+                split.keys = set(child.keys)
+                child.prefix = child.prefix[common:]
+                split.children[child.prefix[0]] = child
+                node.children[text[0]] = split
+                child = split
+
+            child.keys.add(key)
+            text = text[common:]
+            node = child
+
+    def prefix(self, query):
+        """Get the keys of every inserted string that starts with query.
+
+        Returns:
+            set: The matching keys. Callers must not modify it.
+        """
+        node = self.root
+        while query:
+            child = node.children.get(query[0])
+            if child is None:
+                return set()
+            common = _common_prefix_length(child.prefix, query)
+            if common == len(query):
+                return child.keys
+            if common < len(child.prefix):
+                return set()
+            query = query[common:]
+            node = child
+        return node.keys
+
+
+class SearchIndex:
+    """Substring search over short texts, such as clip labels.
+
+    Each whitespace-separated token is indexed by all of its suffixes, so
+    a query without whitespace matches a text exactly when it is a prefix
+    of one of those suffixes. A query containing whitespace is split into
+    pieces whose matches are intersected, and only those candidates are
+    checked against the full query.
+    """
+
+    def __init__(self):
+        self._texts = {}
+        self._trie = PrefixTrie()
+        self._stale = 0
+
+    def add(self, key, text):
+        """Index text under key, replacing any text previously indexed for it.
+
+        Args:
+            key: Identifier returned by search.
+            text: The text to search, already case-folded.
+        """
+        old = self._texts.get(key)
+        if old == text:
+            return
+        if old is not None:
+            self._stale += 1
+        self._texts[key] = text
+        for token in set(text.split()):
+            for i in range(len(token)):
+                self._trie.insert(token[i:], key)
+        self._maybe_rebuild()
+
+    def discard(self, key):
+        """Stop returning key from searches."""
+        if self._texts.pop(key, None) is not None:
+            self._stale += 1
+            self._maybe_rebuild()
+
+    def search(self, query):
+        """Get the keys whose text contains query.
+
+        Args:
+            query: The case-folded search string.
+
+        Returns:
+            set: The matching keys.
+        """
+        pieces = query.split()
+        if not pieces:
+            return {key for key, text in self._texts.items() if query in text}
+        
+        # Each piece lies inside a single token, so every matching text is
+        # indexed under all of them
+        candidates = None
+        for piece in pieces:
+            keys = self._trie.prefix(piece)
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return set()
+        
+        # Replaced or discarded texts are left in the trie until the next
+        # rebuild, so candidates are confirmed against the current text
+        texts = self._texts
+        return {key for key in candidates if key in texts and query in texts[key]}
+
+    def _maybe_rebuild(self):
+        """Rebuild the trie once stale entries outnumber live ones."""
+        if self._stale <= len(self._texts):
+            return
+        texts = self._texts
+        self._texts = {}
+        self._trie = PrefixTrie()
+        self._stale = 0
+        for key, text in texts.items():
+            self.add(key, text)
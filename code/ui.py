@@ -1,14 +1,57 @@
 # ui.py
 import customtkinter as ctk
-from datetime import datetime
+import atexit
 import json
 import os
+import threading
+import time
+from code.jsonio import json_dumps, json_loads
+from code.search_index import SearchIndex
+
+VISIBLE_POLL_MS = 500
+HIDDEN_POLL_MS = 2000
+SETTINGS_SAVE_DELAY_MS = 500
+SEARCH_DELAY_MS = 120
+REFRESH_DELAY_MS = 100
+# Clip rows have a fixed height so only the rows in view need widgets
+ROW_HEIGHT = 56
+ROW_PADY = 2
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Feedback type -> (background, text) colors
+FEEDBACK_COLORS = {
+    'success': ("green", "white"),
+    'error': ("red", "white"),
+    'warning': ("orange", "black"),
+    'info': ("blue", "white")
+}
+
+def format_timestamp(timestamp):
+    """Format an epoch timestamp from the history for display."""
+    return time.strftime(TIMESTAMP_FORMAT, time.localtime(timestamp))
 
 class UIManager:
     def __init__(self, history_manager):
         self.history_manager = history_manager
         self.window_pinned = False
         self.pin_button = None 
+        self._poll_interval_ms = HIDDEN_POLL_MS
+        self._clip_text = {}
+        self._search_index = SearchIndex()
+        self._items = []
+        self._history = None
+        self._search_text = None
+        self._pool = []
+        self._first_row = 0
+        self._filter_job = None
+        self._refresh_pending = False
+        self._settings_save_job = None
+        self._saved_settings = None
+        self._current_theme = "dark"
+        self._settings_window = None
+        self._feedback_label = None
+        self._feedback_job = None
+        # HistoryManager creates the data directory, so it never needs creating here
+        self._settings_path = os.path.join(self.history_manager.data_dir, 'settings.json')
         
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("dark-blue")
@@ -23,14 +66,19 @@ class UIManager:
         self.settings = {}
         self.create_gui()
         self.load_settings()
+        atexit.register(self._flush_pending_settings)
         
         self.root.withdraw()
         
         self.root.protocol("WM_DELETE_WINDOW", self.hide_clipboard)
         self.root.bind('<Escape>', lambda e: self.hide_clipboard())
-        self.root.after(1000, self.check_clipboard_updates)
+        if not self.history_manager.clipboard_manager.watching:
+            threading.Thread(target=self.check_clipboard_updates, daemon=True).start()
 
     def create_gui(self):
+        # One font object for every pooled row instead of one per widget
+        self._row_font = ctk.CTkFont()
+        
         search_frame = ctk.CTkFrame(self.root, height=40)
         search_frame.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
         search_frame.grid_columnconfigure(0, weight=1)
@@ -43,7 +91,7 @@ class UIManager:
             textvariable=self.search_var
         )
         self.search_entry.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
-        self.search_var.trace('w', lambda *args: self.filter_clips())
+        self.search_var.trace('w', lambda *args: self.schedule_filter())
         
         clear_button = ctk.CTkButton(
             search_frame,
@@ -54,9 +102,23 @@ class UIManager:
         )
         clear_button.grid(row=0, column=1, padx=5, pady=5)
         
-        self.clips_frame = ctk.CTkScrollableFrame(self.root)
-        self.clips_frame.grid(row=1, column=0, padx=10, pady=(5, 10), sticky="nsew")
+        list_frame = ctk.CTkFrame(self.root)
+        list_frame.grid(row=1, column=0, padx=10, pady=(5, 10), sticky="nsew")
+        list_frame.grid_columnconfigure(0, weight=1)
+        list_frame.grid_rowconfigure(0, weight=1)
+        
+        self.clips_frame = ctk.CTkFrame(list_frame, fg_color="transparent")
+        self.clips_frame.grid(row=0, column=0, sticky="nsew")
         self.clips_frame.grid_columnconfigure(0, weight=1)
+        # The pooled rows must not resize the list; its size comes from the window
+        self.clips_frame.grid_propagate(False)
+        self.clips_frame.bind('<Configure>', lambda e: self.render_clips())
+        
+        self.clips_scrollbar = ctk.CTkScrollbar(list_frame, command=self.scroll_clips)
+        self.clips_scrollbar.grid(row=0, column=1, padx=(0, 3), pady=3, sticky="ns")
+        
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.root.bind_all(sequence, self.on_clips_mousewheel, add=True)
         
         button_frame = ctk.CTkFrame(self.root)
         button_frame.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="ew")
@@ -81,28 +143,28 @@ class UIManager:
         )
         self.pin_button.grid(row=0, column=2, padx=5, pady=5)
 
-    def create_clip_frame(self, item):
-        clip_frame = ctk.CTkFrame(self.clips_frame)
-        clip_frame.grid(sticky="ew", padx=5, pady=2)
+    def create_clip_frame(self):
+        """Create an empty clip row for the pool; bind_clip_frame fills it in."""
+        clip_frame = ctk.CTkFrame(self.clips_frame, height=ROW_HEIGHT)
+        clip_frame.grid_propagate(False)
         clip_frame.grid_columnconfigure(0, weight=1)
-        
-        content = item['content']
-        content_preview = (content[:50] + "...") if len(content) > 50 else content
+        clip_frame.grid_rowconfigure(0, weight=1)
         
         label = ctk.CTkLabel(
             clip_frame,
-            text=f"{item['timestamp']}\n{content_preview}",
+            text="",
+            font=self._row_font,
             justify="left",
             anchor="w"
         )
         label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
         
-        pin_text = "Unpin" if item['pinned'] else "Pin"
         pin_btn = ctk.CTkButton(
             clip_frame,
-            text=pin_text,
+            text="Pin",
             width=60,
-            command=lambda: self.toggle_clip_pin(content)
+            font=self._row_font,
+            command=lambda: self.toggle_clip_pin(clip_frame.content)
         )
         pin_btn.grid(row=0, column=1, padx=5, pady=5)
         
@@ -110,86 +172,244 @@ class UIManager:
             clip_frame,
             text="Copy",
             width=60,
-            command=lambda: self.copy_to_clipboard(content)
+            font=self._row_font,
+            command=lambda: self.copy_to_clipboard(clip_frame.content)
         )
         copy_btn.grid(row=0, column=2, padx=5, pady=5)
         
+        clip_frame.label = label
+        clip_frame.pin_btn = pin_btn
+        clip_frame.content = None
+        clip_frame.label_text = None
+        clip_frame.pinned = None
+        clip_frame.visible = False
         return clip_frame
 
+    def bind_clip_frame(self, clip_frame, item):
+        """Point a pooled clip row at a history item, reconfiguring only what changed."""
+        _, label_text, _ = self.get_clip_text(item)
+        clip_frame.content = item['content']
+        if clip_frame.label_text != label_text:
+            clip_frame.label_text = label_text
+            clip_frame.label.configure(text=label_text)
+        if clip_frame.pinned != item['pinned']:
+            clip_frame.pinned = item['pinned']
+            clip_frame.pin_btn.configure(text="Unpin" if item['pinned'] else "Pin")
+
+    def get_clip_text(self, item):
+        """Get the label text and case-folded search key for a history item.
+        
+        Returns:
+            tuple: (timestamp, label_text, search_key), cached per content
+            until the item's timestamp changes.
+        """
+        cached = self._clip_text.get(item['content'])
+        if cached is None or cached[0] != item['timestamp']:
+            content = item['content']
+            # Rows have a fixed height, so the preview is kept to one line
+            content_preview = content[:50].replace("\n", " ")
+            if len(content) > 50:
+                content_preview += "..."
+            label_text = f"{format_timestamp(item['timestamp'])}\n{content_preview}"
+            cached = (item['timestamp'], label_text, label_text.casefold())
+            self._clip_text[content] = cached
+        return cached
+
     def update_clips_display(self):
-        # Clear existing clips
-        for widget in self.clips_frame.winfo_children():
-            widget.destroy()
+        """Refresh the clip list from the history and the current search.
+        
+        The history manager returns the same list object until the history
+        changes, so the item list is only rebuilt when there is a change.
+        """
+        history = self.history_manager.get_history()
+        search_text = self.search_var.get().casefold()
+        
+        if history is not self._history or search_text != self._search_text:
+            narrowing = (history is self._history and self._search_text
+                         and search_text.startswith(self._search_text))
+            if history is not self._history:
+                self.index_history(history)
+            self._history = history
+            self._search_text = search_text
+            
+            if narrowing:
+                # Extending the query can only drop clips from the current results
+                self._items = [item for item in self._items if search_text in self.get_clip_text(item)[2]]
+            elif search_text:
+                matches = self._search_index.search(search_text)
+                self._items = [item for item in history if item['content'] in matches]
+            else:
+                self._items = history
         
-        # Add clips from history
-        for item in self.history_manager.get_history():
-            self.create_clip_frame(item)
+        self.render_clips()
 
-    def check_clipboard_updates(self):
-        content = self.history_manager.clipboard_manager.check_for_new_content()
-        if content:
-            self.history_manager.add_to_history(content)
+    def index_history(self, history):
+        """Bring the label cache and search index in line with the history."""
+        for item in history:
+            self._search_index.add(item['content'], self.get_clip_text(item)[2])
+        
+        # Stale entries are bounded by the history size before being swept
+        if len(self._clip_text) > len(history):
+            current = {item['content'] for item in history}
+            for content in [c for c in self._clip_text if c not in current]:
+                del self._clip_text[content]
+                self._search_index.discard(content)
+
+    def render_clips(self):
+        """Bind the pooled rows to the clips currently scrolled into view."""
+        scaling = ctk.ScalingTracker.get_widget_scaling(self.clips_frame)
+        row_px = round((ROW_HEIGHT + 2 * ROW_PADY) * scaling)
+        visible_rows = max(1, self.clips_frame.winfo_height() // row_px)
+        
+        while len(self._pool) < visible_rows:
+            clip_frame = self.create_clip_frame()
+            clip_frame.grid(row=len(self._pool), column=0, padx=5, pady=ROW_PADY, sticky="ew")
+            clip_frame.visible = True
+            self._pool.append(clip_frame)
+        
+        total = len(self._items)
+        self._first_row = max(0, min(self._first_row, total - visible_rows))
+        
+        for i, clip_frame in enumerate(self._pool):
+            index = self._first_row + i
+            show = i < visible_rows and index < total
+            if show:
+                self.bind_clip_frame(clip_frame, self._items[index])
+            if show != clip_frame.visible:
+                clip_frame.visible = show
+                if show:
+                    clip_frame.grid()
+                else:
+                    clip_frame.grid_remove()
+        
+        if total:
+            self.clips_scrollbar.set(
+                self._first_row / total, min(1.0, (self._first_row + visible_rows) / total))
+        else:
+            self.clips_scrollbar.set(0.0, 1.0)
+
+    def scroll_clips(self, action, amount, unit=None):
+        """Scrollbar command: move the first visible row."""
+        if action == 'moveto':
+            self._first_row = int(float(amount) * len(self._items))
+        else:
+            self._first_row += int(amount)
+        self.render_clips()
+
+    def on_clips_mousewheel(self, event):
+        """Scroll the clip list when the wheel is used over it."""
+        widget_path = str(event.widget)
+        list_path = str(self.clips_frame)
+        if widget_path != list_path and not widget_path.startswith(list_path + "."):
+            return
+        if event.num == 4 or event.delta > 0:
+            self.scroll_clips('scroll', -1)
+        else:
+            self.scroll_clips('scroll', 1)
+
+    def refresh_clips(self):
+        """Redraw the clip list if the window is currently shown."""
+        if self.root.state() != 'withdrawn':
             self.update_clips_display()
-        self.root.after(1000, self.check_clipboard_updates)
+
+    def schedule_refresh(self):
+        """Refresh the clip list shortly, folding a burst of changes into one redraw.
+        
+        Called from the clipboard threads whenever a clip is recorded.
+        """
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.root.after(REFRESH_DELAY_MS, self._run_scheduled_refresh)
+
+    def _run_scheduled_refresh(self):
+        self._refresh_pending = False
+        self.refresh_clips()
+
+    def check_clipboard_updates(self):
+        """Poll the clipboard when XFixes change notifications are unavailable.
+        
+        Runs on its own thread, since a read can wait on the selection owner
+        for up to a second; only the redraw is handed to the Tk thread.
+        """
+        clipboard_manager = self.history_manager.clipboard_manager
+        while True:
+            time.sleep(self._poll_interval_ms / 1000)
+            content = clipboard_manager.check_for_new_content()
+            if content:
+                self.history_manager.add_to_history(content)
+                self.schedule_refresh()
 
     def copy_to_clipboard(self, content):
-        """Copy content to clipboard with error handling, feedback, and delay."""
+        """Copy content to the clipboard without blocking the window.
+        
+        Large clips are handed to xsel, so the copy runs on a worker thread
+        and its feedback is posted back to the Tk thread.
+        """
         if not content:
             self.show_feedback("Nothing to copy", "warning")
-            return False
+            return
         
-        try:
-            success = self.history_manager.clipboard_manager.set_clipboard_content(content)
-            
-            if success:
-                self.show_feedback("Copied successfully!", "success")
-                self.root.after(1000, self.hide_clipboard)
-                return True
-            else:
-                self.show_feedback("Failed to copy content", "error")
-                return False
-                
-        except Exception as e:
-            print(f"Error copying to clipboard: {e}")
-            self.show_feedback(f"Error copying: {str(e)}", "error")
-            return False
+        def copy():
+            try:
+                success = self.history_manager.clipboard_manager.set_clipboard_content(content)
+                self.root.after_idle(self.on_copy_finished, success, None)
+            except Exception as e:
+                print(f"Error copying to clipboard: {e}")
+                self.root.after_idle(self.on_copy_finished, False, e)
+        
+        threading.Thread(target=copy, daemon=True).start()
+
+    def on_copy_finished(self, success, error):
+        """Report the result of copy_to_clipboard."""
+        if error is not None:
+            self.show_feedback(f"Error copying: {str(error)}", "error")
+        elif success:
+            self.show_feedback("Copied successfully!", "success")
+            self.root.after(1000, self.hide_clipboard)
+        else:
+            self.show_feedback("Failed to copy content", "error")
 
     def show_feedback(self, message, type_="info"):
-        """Show feedback message to user."""
-        colors = {
-            'success': ("green", "white"),
-            'error': ("red", "white"),
-            'warning': ("orange", "black"),
-            'info': ("blue", "white")
-        }
-        
-        fg_color, text_color = colors.get(type_, colors['info'])
-        
-        feedback = ctk.CTkLabel(
-            self.root,
-            text=message,
-            fg_color=fg_color,
-            text_color=text_color,
-            corner_radius=8,
-            padx=10,
-            pady=5
-        )
-        feedback.place(relx=0.5, rely=0.9, anchor="center")
-        self.root.after(2000, feedback.destroy)
+        """Show feedback message to user, reusing a single label."""
+        fg_color, text_color = FEEDBACK_COLORS.get(type_, FEEDBACK_COLORS['info'])
+        
+        if self._feedback_label is None:
+            self._feedback_label = ctk.CTkLabel(
+                self.root,
+                text="",
+                corner_radius=8,
+                padx=10,
+                pady=5
+            )
+        self._feedback_label.configure(text=message, fg_color=fg_color, text_color=text_color)
+        self._feedback_label.place(relx=0.5, rely=0.9, anchor="center")
+        self._feedback_label.lift()
+        
+        # A newer message restarts the timer instead of being hidden early
+        if self._feedback_job is not None:
+            self.root.after_cancel(self._feedback_job)
+        self._feedback_job = self.root.after(2000, self.hide_feedback)
+
+    def hide_feedback(self):
+        self._feedback_job = None
+        self._feedback_label.place_forget()
 
     def toggle_clip_pin(self, content):
         self.history_manager.toggle_pin(content)
         self.update_clips_display()
 
+    def schedule_filter(self):
+        """Filter the clips once typing pauses instead of on every keystroke."""
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(SEARCH_DELAY_MS, self.filter_clips)
+
     def filter_clips(self):
-        search_text = self.search_var.get().lower()
-        for widget in self.clips_frame.winfo_children():
-            if isinstance(widget, ctk.CTkFrame):
-                label = widget.winfo_children()[0]
-                if search_text in label.cget("text").lower():
-                    widget.grid()
-                else:
-                    widget.grid_remove()
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+            self._filter_job = None
+        self._first_row = 0
+        self.update_clips_display()
 
     def clear_search(self):
         self.search_var.set("")
@@ -200,9 +420,15 @@ class UIManager:
         self.update_clips_display()
 
     def toggle_pin(self):
-        """Toggle window pin state and apply window constraints."""
+        """Toggle window pin state and remember it in the settings."""
+        self._apply_pin_state(not self.window_pinned)
+        self.settings['window_pinned'] = self.window_pinned
+        self.save_settings()
+
+    def _apply_pin_state(self, pinned):
+        """Apply the window constraints for a pin state without saving it."""
         try:
-            self.window_pinned = not self.window_pinned
+            self.window_pinned = pinned
             
             self.root.attributes('-topmost', self.window_pinned)
             
@@ -215,14 +441,12 @@ class UIManager:
                 self.root.resizable(True, True)
                 self.pin_button.configure(text="Pin Window")
             
-            self.settings['window_pinned'] = self.window_pinned
-            self.save_settings()
-            
         except Exception as e:
             print(f"Error in toggle_pin: {e}")
     
     def show_clipboard(self):
         """Shows the clipboard window"""
+        self._poll_interval_ms = VISIBLE_POLL_MS
         self.update_clips_display()
         self.root.deiconify()
         self.root.lift()
@@ -233,20 +457,19 @@ class UIManager:
     def hide_clipboard(self):
         """Hides the clipboard window instead of closing the application"""
         self.root.withdraw()
+        self._poll_interval_ms = HIDDEN_POLL_MS
         self.clear_search()
 
     def load_settings(self):
         """Load settings with error handling."""
         self.settings = {}
         try:
-            settings_dir = os.path.dirname(self.history_manager.history_file)
-            settings_file = os.path.join(settings_dir, 'settings.json')
-            os.makedirs(settings_dir, exist_ok=True)
+            settings_file = self._settings_path
             
             if os.path.exists(settings_file):
                 try:
-                    with open(settings_file, 'r', encoding='utf-8') as f:
-                        self.settings = json.load(f)
+                    with open(settings_file, 'rb') as f:
+                        self.settings = json_loads(f.read())
                 except json.JSONDecodeError:
                     print("Settings file is corrupted, using defaults")
                     corrupted_file = f"{settings_file}.corrupted"
@@ -254,6 +477,7 @@ class UIManager:
                 except Exception as e:
                     print(f"Error loading settings: {e}")
             
+            self._saved_settings = dict(self.settings)
             self.apply_settings()
             
         except Exception as e:
@@ -269,53 +493,88 @@ class UIManager:
             theme = self.settings.get('theme', 'dark')
             self.change_theme(theme)
             
+            max_items = self.settings.get('max_items')
+            # A bad value would break trimming on the clipboard thread, so the
+            # history manager keeps its default unless the setting is valid
+            if isinstance(max_items, int) and not isinstance(max_items, bool) and max_items > 0:
+                self.history_manager.max_items = max_items
+            
             if self.settings.get('window_pinned', False):
-                self.window_pinned = True
-                self.toggle_pin()
+                self._apply_pin_state(True)
                 
         except Exception as e:
             print(f"Error applying settings: {e}")
 
     def save_settings(self):
-        settings_file = os.path.join(
-            os.path.dirname(self.history_manager.history_file),
-            'settings.json'
-        )
+        """Schedule the settings to be written, coalescing rapid changes into one write."""
+        if self._settings_save_job is None:
+            self._settings_save_job = self.root.after(SETTINGS_SAVE_DELAY_MS, self._write_settings)
+
+    def _flush_pending_settings(self):
+        """Write out a settings save that is still waiting to run."""
+        if self._settings_save_job is not None:
+            self._write_settings()
+
+    def _write_settings(self):
+        self._settings_save_job = None
+        # Changes that were undone before the save ran leave nothing to write
+        if self.settings == self._saved_settings:
+            return
+        settings_file = self._settings_path
+        tmp_file = f"{settings_file}.tmp"
         try:
-            with open(settings_file, 'w') as f:
-                json.dump(self.settings, f)
+            # Write beside the real file and swap it in, so a crash mid-write
+            # never leaves a truncated settings file behind
+            with open(tmp_file, 'wb') as f:
+                f.write(json_dumps(self.settings))
+            os.replace(tmp_file, settings_file)
+            self._saved_settings = dict(self.settings)
         except Exception as e:
             print(f"Error saving settings: {e}")
 
     def change_theme(self, theme):
+        if theme == self._current_theme:
+            return
         try:
             ctk.set_appearance_mode(theme)
+            self._current_theme = theme
             self.settings['theme'] = theme
             self.save_settings()
         except Exception as e:
             print(f"Error changing theme: {e}")
 
     def show_settings(self):
-        settings_window = ctk.CTkToplevel(self.root)
-        settings_window.title("Settings")
-        settings_window.geometry("300x400")
+        """Show the settings window, building it on first use."""
+        if self._settings_window is None:
+            self._settings_window = self.create_settings_window()
+        else:
+            self._settings_theme_var.set(self.settings.get('theme', 'dark'))
+            self._settings_window.deiconify()
+        settings_window = self._settings_window
         
         settings_window.update()
         
         x = self.root.winfo_x() + (self.root.winfo_width() - settings_window.winfo_width()) // 2
         y = self.root.winfo_y() + (self.root.winfo_height() - settings_window.winfo_height()) // 2
         settings_window.geometry(f"+{x}+{y}")
+        settings_window.lift()
         
         settings_window.after(100, lambda: settings_window.grab_set())
+
+    def create_settings_window(self):
+        settings_window = ctk.CTkToplevel(self.root)
+        settings_window.title("Settings")
+        settings_window.geometry("300x400")
+        settings_window.protocol("WM_DELETE_WINDOW", self.hide_settings)
         
         theme_label = ctk.CTkLabel(settings_window, text="Theme:")
         theme_label.pack(pady=(20, 5))
         
-        theme_var = ctk.StringVar(value=self.settings.get('theme', 'dark'))
+        self._settings_theme_var = ctk.StringVar(value=self.settings.get('theme', 'dark'))
         theme_menu = ctk.CTkOptionMenu(
             settings_window,
             values=["light", "dark", "system"],
-            variable=theme_var,
+            variable=self._settings_theme_var,
             command=lambda x: self.change_theme(x)
         )
         theme_menu.pack(pady=5)
@@ -323,5 +582,11 @@ class UIManager:
         ctk.CTkButton(
             settings_window,
             text="Close",
-            command=settings_window.destroy
-        ).pack(pady=20)
\ No newline at end of file
+            command=self.hide_settings
+        ).pack(pady=20)
+        return settings_window
+
+    def hide_settings(self):
+        """Hide the settings window so the next show_settings can reuse it."""
+        self._settings_window.grab_release()
+        self._settings_window.withdraw()
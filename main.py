@@ -1,5 +1,6 @@
 # main.py
 import signal
+from Xlib.display import Display
 from code.clipboard import ClipboardManager
 from code.history_manager import HistoryManager
 from code.ui import UIManager
@@ -7,10 +8,11 @@ from code.hotkeys import HotkeyManager
 
 
 def main():
-    clipboard_manager = ClipboardManager()
+    xdisplay = Display()
+    clipboard_manager = ClipboardManager(display=xdisplay)
     history_manager = HistoryManager(clipboard_manager)
     ui_manager = UIManager(history_manager)
-    hotkey_manager = HotkeyManager(clipboard_manager, history_manager, ui_manager)
+    hotkey_manager = HotkeyManager(clipboard_manager, history_manager, ui_manager, display=xdisplay)
     
     def signal_handler(signum, frame):
         print("\nCerrando aplicación...")